@@ -31,3 +31,12 @@ TOP_LEAGUES = {
 
 # Current season (update annually)
 CURRENT_SEASON = "2023"
+
+# Prediction service settings
+SERVICE_HOST = os.getenv('SERVICE_HOST', '127.0.0.1')  # Set to 0.0.0.0 to expose the service on the network
+SERVICE_PORT = int(os.getenv('SERVICE_PORT', '8080'))
+BATCH_WINDOW_MS = 2  # Time (in milliseconds) to wait for concurrent requests to join a batch
+MAX_BATCH_SIZE = 64  # Maximum number of matchups scored in one inference call
+PREDICTION_CACHE_SIZE = 4096  # Maximum number of on-demand (not pre-scored) matchups kept in the prediction cache
+LATENCY_WINDOW = 10000  # Number of recent request latencies kept for percentile reporting
+MODEL_RELOAD_INTERVAL = 60  # Time (in seconds) between checks for a retrained model or new football data on disk
@@ -7,9 +7,12 @@ import logging
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Path to the fetched football data
+FOOTBALL_DATA_PATH = 'football_data.json'
+
 # Load fetched football data
 try:
-    with open('football_data.json', 'r') as f:
+    with open(FOOTBALL_DATA_PATH, 'r') as f:
         football_data = json.load(f)
     logging.info(f"Loaded football_data.json. Keys: {football_data.keys()}")
 except FileNotFoundError:
@@ -75,23 +78,17 @@ def calculate_recent_performance(h2h_data: List[Dict], team_id: int, num_matches
                       1 if match['goals']['home'] == match['goals']['away'] else 0 for match in recent_matches)
     return performance / (len(recent_matches) * 3)
 
-def feature_engineering(home_team_id: int, away_team_id: int, league_id: int) -> pd.DataFrame:
-    """Generate features for match prediction."""
-    home_team_stats, home_standings = get_team_data(home_team_id, league_id)
-    away_team_stats, away_standings = get_team_data(away_team_id, league_id)
-
-    home_injuries = get_injuries(home_team_id, league_id)
-    away_injuries = get_injuries(away_team_id, league_id)
-
-    h2h_data = get_h2h_data(home_team_id, away_team_id)
-
-    features = {
+def build_feature_row(home_team_id: int, away_team_id: int, home_team_stats: Dict, away_team_stats: Dict,
+                      home_standings: Dict, away_standings: Dict, home_injuries: int, away_injuries: int,
+                      h2h_data: List[Dict]) -> Dict[str, float]:
+    """Build the feature dict for a matchup from already looked-up team data."""
+    return {
         'home_team_rank': home_standings.get('rank', 0),
         'away_team_rank': away_standings.get('rank', 0),
         'home_team_form': calculate_form(home_standings.get('form', '')),
         'away_team_form': calculate_form(away_standings.get('form', '')),
-        'home_team_injuries': len(home_injuries),
-        'away_team_injuries': len(away_injuries),
+        'home_team_injuries': home_injuries,
+        'away_team_injuries': away_injuries,
         'home_team_goal_diff': home_standings.get('goalsDiff', 0),
         'away_team_goal_diff': away_standings.get('goalsDiff', 0),
         'home_team_clean_sheets': home_team_stats.get('clean_sheet', {}).get('total', 0),
@@ -104,8 +101,79 @@ def feature_engineering(home_team_id: int, away_team_id: int, league_id: int) ->
         'away_team_recent_performance': calculate_recent_performance(h2h_data, away_team_id),
     }
 
+def feature_engineering(home_team_id: int, away_team_id: int, league_id: int) -> pd.DataFrame:
+    """Generate features for match prediction."""
+    home_team_stats, home_standings = get_team_data(home_team_id, league_id)
+    away_team_stats, away_standings = get_team_data(away_team_id, league_id)
+
+    home_injuries = get_injuries(home_team_id, league_id)
+    away_injuries = get_injuries(away_team_id, league_id)
+
+    h2h_data = get_h2h_data(home_team_id, away_team_id)
+
+    features = build_feature_row(home_team_id, away_team_id, home_team_stats, away_team_stats,
+                                 home_standings, away_standings, len(home_injuries), len(away_injuries), h2h_data)
+
     return pd.DataFrame([features])
 
+class FeatureIndex:
+    """
+    Per-league team lookups precomputed once from the loaded football data.
+
+    Produces the same features as feature_engineering() but without the linear
+    standings scans and per-call logging, for use in long-running services.
+    """
+
+    def __init__(self, data: Dict = None):
+        data = football_data if data is None else data
+        self.standings: Dict[int, Dict[int, Dict]] = {}
+        self.team_stats: Dict[int, Dict[int, Dict]] = {}
+        self.injury_counts: Dict[int, Dict[int, int]] = {}
+        self.h2h: Dict[str, List[Dict]] = {key: value.get('response', [])
+                                           for key, value in data.get('h2h', {}).items()}
+
+        for league, league_standings in data.get('standings', {}).items():
+            self.standings[int(league)] = {team['team']['id']: team for team in league_standings.get('response', [])}
+        for league, league_stats in data.get('team_statistics', {}).items():
+            self.team_stats[int(league)] = {int(team_id): stats for team_id, stats in league_stats.items()
+                                            if str(team_id).isascii() and str(team_id).isdigit()}
+        for league, league_injuries in data.get('injuries', {}).items():
+            counts: Dict[int, int] = {}
+            for injury in league_injuries.get('response', []):
+                team_id = injury['team']['id']
+                counts[team_id] = counts.get(team_id, 0) + 1
+            self.injury_counts[int(league)] = counts
+
+        logging.info(f"Feature index built for {len(self.standings)} leagues")
+
+    @classmethod
+    def from_file(cls, path: str = FOOTBALL_DATA_PATH) -> 'FeatureIndex':
+        """Build an index from a football data JSON file, e.g. after datafetcher.py rewrites it."""
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    def matchups(self, league_ids: List[int]) -> List[Tuple[int, int, int]]:
+        """Return every (league_id, home_team_id, away_team_id) pairing of teams in the given leagues' standings."""
+        return [(league_id, home_team_id, away_team_id)
+                for league_id in league_ids
+                for home_team_id in self.standings.get(league_id, {})
+                for away_team_id in self.standings.get(league_id, {})
+                if home_team_id != away_team_id]
+
+    def has_team(self, team_id: int, league_id: int) -> bool:
+        """Return True if the team appears in the league standings."""
+        return team_id in self.standings.get(league_id, {})
+
+    def feature_row(self, home_team_id: int, away_team_id: int, league_id: int) -> Dict[str, float]:
+        league_stats = self.team_stats.get(league_id, {})
+        league_standings = self.standings.get(league_id, {})
+        league_injuries = self.injury_counts.get(league_id, {})
+        return build_feature_row(home_team_id, away_team_id,
+                                 league_stats.get(home_team_id, {}), league_stats.get(away_team_id, {}),
+                                 league_standings.get(home_team_id, {}), league_standings.get(away_team_id, {}),
+                                 league_injuries.get(home_team_id, 0), league_injuries.get(away_team_id, 0),
+                                 self.h2h.get(f"{home_team_id}-{away_team_id}", []))
+
 def main():
     try:
         # Sample data - replace with actual team IDs and league ID
@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import random
+import time
+from typing import List
+
+import aiohttp
+import numpy as np
+
+from config import SERVICE_HOST, SERVICE_PORT
+
+
+async def send_request(session: aiohttp.ClientSession, url: str, params: dict,
+                       latencies: List[float], errors: List[int]):
+    start = time.perf_counter()
+    async with session.get(url, params=params) as response:
+        await response.read()
+        if response.status != 200:
+            errors.append(response.status)
+    latencies.append(time.perf_counter() - start)
+
+
+async def run_load_test(base_url: str, league_id: int, team_ids: List[int], rate: float, total: int):
+    """Send requests for random matchups at a fixed rate and report client-side latency."""
+    latencies, errors = [], []
+    matchups = [(home, away) for home in team_ids for away in team_ids if home != away]
+    async with aiohttp.ClientSession() as session:
+        tasks = []
+        start = time.perf_counter()
+        for i in range(total):
+            # Open-loop pacing so slow responses do not lower the offered load
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            home_team_id, away_team_id = random.choice(matchups)
+            params = {'league_id': league_id, 'home_team_id': home_team_id, 'away_team_id': away_team_id}
+            tasks.append(asyncio.create_task(send_request(session, f"{base_url}/predict", params,
+                                                          latencies, errors)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        async with session.get(f"{base_url}/latency") as response:
+            server_stats = await response.json()
+
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    print(f"Requests: {total} in {elapsed:.1f}s ({total / elapsed:.0f} req/s), errors: {len(errors)}")
+    print(f"Client latency: p50={p50:.2f} ms, p95={p95:.2f} ms, p99={p99:.2f} ms, max={latencies_ms.max():.2f} ms")
+    print(f"Server stats: {server_stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the prediction service.")
+    parser.add_argument('--url', default=f"http://{SERVICE_HOST}:{SERVICE_PORT}")
+    parser.add_argument('--league', type=int, default=39)
+    parser.add_argument('--teams', type=int, nargs='+', required=True, help="Team IDs in the league")
+    parser.add_argument('--rate', type=float, default=300, help="Requests per second")
+    parser.add_argument('--requests', type=int, default=6000)
+    args = parser.parse_args()
+    asyncio.run(run_load_test(args.url, args.league, args.teams, args.rate, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ import logging
 import joblib
 from config import DB_PATH, MAX_RETRIES
 import os
-from typing import Tuple
+from typing import List, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +59,14 @@ class PredictionModel:
         confidence = np.max(probabilities)
         return predicted_class, confidence
 
+    def predict_batch(self, X: pd.DataFrame) -> List[Tuple[str, float]]:
+        """Predict outcomes for every row of X in a single inference call."""
+        X_scaled = self.scaler.transform(X)
+        probabilities = self.model.predict_proba(X_scaled)
+        predicted_classes = self.model.classes_[np.argmax(probabilities, axis=1)]
+        confidences = np.max(probabilities, axis=1)
+        return list(zip(predicted_classes, confidences))
+
     def get_feature_importance(self) -> pd.DataFrame:
         feature_importance = pd.DataFrame({
             'feature': self.model.feature_names_in_,
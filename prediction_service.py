@@ -0,0 +1,443 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from config import (TOP_LEAGUES, SERVICE_HOST, SERVICE_PORT, BATCH_WINDOW_MS, MAX_BATCH_SIZE,
+                    PREDICTION_CACHE_SIZE, LATENCY_WINDOW, MODEL_RELOAD_INTERVAL)
+from feature_engineering import FOOTBALL_DATA_PATH, FeatureIndex
+from model import PredictionModel
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# (league_id, home_team_id, away_team_id)
+MatchupKey = Tuple[int, int, int]
+
+# Status recorded for requests abandoned by the client before a response was sent
+CLIENT_CLOSED_REQUEST = 499
+
+
+class PredictionCache:
+    """
+    Prediction cache with a pinned set of pre-scored matchups and an LRU for the rest.
+
+    Entries never expire: features and model only change on reload, which replaces
+    the whole cache.
+    """
+
+    def __init__(self, max_size: int = PREDICTION_CACHE_SIZE):
+        self.max_size = max_size
+        self.pinned: Dict[MatchupKey, Dict[str, Any]] = {}
+        self.entries: "OrderedDict[MatchupKey, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.pinned) + len(self.entries)
+
+    def get(self, key: MatchupKey) -> Optional[Dict[str, Any]]:
+        prediction = self.pinned.get(key)
+        if prediction is None:
+            prediction = self.entries.get(key)
+            if prediction is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+        self.hits += 1
+        return prediction
+
+    def set(self, key: MatchupKey, prediction: Dict[str, Any]):
+        if key in self.pinned:
+            self.pinned[key] = prediction
+            return
+        self.entries[key] = prediction
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def replace(self, pinned: Dict[MatchupKey, Dict[str, Any]]):
+        """Swap in a freshly pre-scored set of matchups and drop everything else."""
+        self.pinned = pinned
+        self.entries = OrderedDict()
+
+    def clear(self):
+        self.replace({})
+
+
+class PredictionService:
+    """
+    Serves on-demand predictions from a resident PredictionModel.
+
+    Every matchup in the TOP_LEAGUES standings is pre-scored in one batch at startup
+    and after each reload. Other requests are queued and coalesced for up to
+    BATCH_WINDOW_MS into one batched inference call; duplicate in-flight matchups
+    share a single result. The model and football data are reloaded when a retrained
+    model or a new data file appears on disk.
+    """
+
+    def __init__(self, model: Optional[PredictionModel] = None, features: Optional[FeatureIndex] = None,
+                 batch_window_ms: float = BATCH_WINDOW_MS, max_batch_size: int = MAX_BATCH_SIZE,
+                 reload_interval: float = MODEL_RELOAD_INTERVAL, data_path: str = FOOTBALL_DATA_PATH):
+        self.model = model or PredictionModel()
+        self.features = features or FeatureIndex()
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.reload_interval = reload_interval
+        self.data_path = data_path
+        self.model_mtime = self.get_model_mtime()
+        self.data_mtime = self.get_data_mtime()
+        self.generation = 0
+        self.cache = PredictionCache()
+        self.queue: Optional[asyncio.Queue] = None
+        self.pending: Dict[MatchupKey, asyncio.Future] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.request_count = 0
+        self.errors = Counter()
+        self.batch_count = 0
+        self.batched_requests = 0
+        self.started_at = time.time()
+
+    @property
+    def ready(self) -> bool:
+        return self.model.model is not None
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        if self.ready:
+            self.cache.replace(await self.prescore(self.model, self.features))
+        self.tasks = [asyncio.create_task(self.batch_worker())]
+        if self.reload_interval:
+            self.tasks.append(asyncio.create_task(self.reload_watcher()))
+        logger.info(f"Prediction service started (batch window {self.batch_window * 1000:.1f} ms, "
+                    f"max batch size {self.max_batch_size})")
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.tasks = []
+        for future in self.pending.values():
+            if not future.done():
+                future.cancel()
+        self.pending.clear()
+
+    async def predict(self, league_id: int, home_team_id: int, away_team_id: int) -> Dict[str, Any]:
+        """Return the prediction for a matchup, from cache or via the batching queue."""
+        key = (league_id, home_team_id, away_team_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return {**cached, 'cached': True}
+
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[key] = future
+            self.queue.put_nowait((key, future))
+        # Shield so one cancelled client does not cancel the result shared with others
+        prediction = await asyncio.shield(future)
+        return {**prediction, 'cached': False}
+
+    async def batch_worker(self):
+        """Collect queued matchups into batches and score them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            if self.queue.qsize() < self.max_batch_size - 1:
+                await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            keys = [key for key, _ in batch]
+            model, features, generation = self.model, self.features, self.generation
+            try:
+                # Inference is CPU-bound; keep it off the event loop
+                results = await loop.run_in_executor(None, self.infer, model, features, keys)
+            except Exception as e:
+                results = [e] * len(keys)
+
+            self.batch_count += 1
+            self.batched_requests += len(batch)
+            for (key, future), result in zip(batch, results):
+                self.pending.pop(key, None)
+                if isinstance(result, Exception):
+                    logger.error(f"Prediction failed for matchup {key}: {str(result)}")
+                    if not future.done():
+                        future.set_exception(result)
+                    continue
+                # Results from a model or data swapped out mid-batch are served but not cached
+                if generation == self.generation:
+                    self.cache.set(key, result)
+                if not future.done():
+                    future.set_result(result)
+
+    def infer(self, model: PredictionModel, features: FeatureIndex,
+              keys: List[MatchupKey]) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        Build features for every matchup and run one batched model call.
+
+        Failures are returned per matchup so one bad input cannot fail the rest of its batch.
+        """
+        results: List[Union[Dict[str, Any], Exception]] = [None] * len(keys)
+        rows, row_indices = [], []
+        for i, (league_id, home_team_id, away_team_id) in enumerate(keys):
+            try:
+                rows.append(features.feature_row(home_team_id, away_team_id, league_id))
+                row_indices.append(i)
+            except Exception as e:
+                results[i] = e
+        if not rows:
+            return results
+
+        frame = pd.DataFrame(rows)
+        try:
+            predictions = model.predict_batch(frame)
+        except Exception:
+            # Fall back to scoring rows one at a time to isolate the bad input
+            predictions = []
+            for j in range(len(frame)):
+                try:
+                    predictions.append(model.predict(frame.iloc[[j]]))
+                except Exception as e:
+                    predictions.append(e)
+
+        for i, prediction in zip(row_indices, predictions):
+            if isinstance(prediction, Exception):
+                results[i] = prediction
+                continue
+            league_id, home_team_id, away_team_id = keys[i]
+            predicted_outcome, probability = prediction
+            results[i] = {
+                'league_id': league_id,
+                'home_team_id': home_team_id,
+                'away_team_id': away_team_id,
+                'predicted_outcome': str(predicted_outcome),
+                'probability': float(probability),
+            }
+        return results
+
+    async def prescore(self, model: PredictionModel, features: FeatureIndex) -> Dict[MatchupKey, Dict[str, Any]]:
+        """Score every matchup in the TOP_LEAGUES standings in one batched call."""
+        keys = features.matchups(list(TOP_LEAGUES))
+        if not keys:
+            return {}
+        started = time.perf_counter()
+        results = await asyncio.get_running_loop().run_in_executor(None, self.infer, model, features, keys)
+        prescored = {key: result for key, result in zip(keys, results) if not isinstance(result, Exception)}
+        logger.info(f"Pre-scored {len(prescored)}/{len(keys)} matchups in {time.perf_counter() - started:.2f}s")
+        return prescored
+
+    def get_model_mtime(self) -> Optional[float]:
+        """
+        Return the model file's modification time once both files are written.
+
+        save_model() writes the model and then the scaler, so a scaler older than the
+        model means the save is still in progress and None is returned.
+        """
+        try:
+            model_mtime = os.path.getmtime(self.model.model_path)
+            scaler_mtime = os.path.getmtime(self.model.scaler_path)
+        except OSError:
+            return None
+        return model_mtime if scaler_mtime >= model_mtime else None
+
+    def get_data_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.data_path)
+        except OSError:
+            return None
+
+    async def reload_watcher(self):
+        """Periodically reload the model and football data when they change on disk."""
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload_model()
+            except Exception as e:
+                logger.error(f"Error reloading model: {str(e)}")
+            try:
+                await self.reload_data()
+            except Exception as e:
+                logger.error(f"Error reloading football data: {str(e)}")
+
+    async def reload_model(self, force: bool = False) -> bool:
+        """Swap in the model on disk if it changed, re-scoring all matchups. Returns True on swap."""
+        mtime = self.get_model_mtime()
+        if mtime is None or (mtime == self.model_mtime and not force):
+            return False
+        model = await asyncio.get_running_loop().run_in_executor(None, PredictionModel)
+        if model.model is None:
+            logger.warning("Model file changed but could not be loaded; keeping current model")
+            return False
+        prescored = await self.prescore(model, self.features)
+        self.model = model
+        self.model_mtime = mtime
+        self.swap_cache(prescored)
+        logger.info(f"Reloaded model from {model.model_path} (generation {self.generation})")
+        return True
+
+    async def reload_data(self, force: bool = False) -> bool:
+        """Rebuild the feature index if the football data file changed, re-scoring all matchups."""
+        mtime = self.get_data_mtime()
+        if mtime is None or (mtime == self.data_mtime and not force):
+            return False
+        features = await asyncio.get_running_loop().run_in_executor(None, FeatureIndex.from_file, self.data_path)
+        prescored = await self.prescore(self.model, features) if self.ready else {}
+        self.features = features
+        self.data_mtime = mtime
+        self.swap_cache(prescored)
+        logger.info(f"Reloaded football data from {self.data_path} (generation {self.generation})")
+        return True
+
+    def swap_cache(self, prescored: Dict[MatchupKey, Dict[str, Any]]):
+        self.generation += 1
+        self.cache.replace(prescored)
+
+    def record_request(self, seconds: float, status: int):
+        # Abandoned requests are counted but kept out of the latency percentiles
+        if status != CLIENT_CLOSED_REQUEST:
+            self.latencies.append(seconds)
+        self.request_count += 1
+        if status >= 400:
+            self.errors[status] += 1
+
+    def latency_stats(self) -> Dict[str, Any]:
+        stats = {
+            'window': len(self.latencies),
+            'requests': self.request_count,
+            'errors': {str(status): count for status, count in self.errors.items()},
+            'batches': self.batch_count,
+            'avg_batch_size': self.batched_requests / self.batch_count if self.batch_count else 0.0,
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            'cache_size': len(self.cache),
+            'prescored': len(self.cache.pinned),
+        }
+        if self.latencies:
+            latencies_ms = np.array(self.latencies) * 1000
+            p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+            stats.update({
+                'mean_ms': float(latencies_ms.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': float(latencies_ms.max()),
+            })
+        return stats
+
+
+SERVICE_KEY = web.AppKey('service', PredictionService)
+
+
+def parse_id(params, name: str) -> int:
+    """Read an integer ID, accepting only real ints or digit strings."""
+    if name not in params:
+        raise web.HTTPBadRequest(reason=f"Missing parameter: {name}")
+    value = params[name]
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    raise web.HTTPBadRequest(reason=f"{name} must be an integer")
+
+
+def parse_matchup(params) -> MatchupKey:
+    """Validate matchup parameters from a query string or JSON body."""
+    league_id = parse_id(params, 'league_id')
+    home_team_id = parse_id(params, 'home_team_id')
+    away_team_id = parse_id(params, 'away_team_id')
+    if league_id not in TOP_LEAGUES:
+        raise web.HTTPBadRequest(reason=f"Unsupported league: {league_id}")
+    if home_team_id == away_team_id:
+        raise web.HTTPBadRequest(reason="home_team_id and away_team_id must differ")
+    return league_id, home_team_id, away_team_id
+
+
+async def handle_predict(request: web.Request) -> web.Response:
+    service: PredictionService = request.app[SERVICE_KEY]
+    start = time.perf_counter()
+    status = 200
+    try:
+        if not service.ready:
+            raise web.HTTPServiceUnavailable(reason="No trained model loaded")
+
+        if request.method == 'POST':
+            try:
+                params = await request.json()
+            except ValueError:
+                raise web.HTTPBadRequest(reason="Request body must be JSON")
+            if not isinstance(params, dict):
+                raise web.HTTPBadRequest(reason="Request body must be a JSON object")
+        else:
+            params = request.query
+
+        league_id, home_team_id, away_team_id = parse_matchup(params)
+        for team_id in (home_team_id, away_team_id):
+            if not service.features.has_team(team_id, league_id):
+                raise web.HTTPNotFound(reason=f"Team {team_id} not found in league {league_id}")
+
+        prediction = await service.predict(league_id, home_team_id, away_team_id)
+        return web.json_response(prediction)
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    except asyncio.CancelledError:
+        status = CLIENT_CLOSED_REQUEST
+        raise
+    except Exception:
+        status = 500
+        logger.exception("Unexpected error handling prediction request")
+        raise web.HTTPInternalServerError(reason="Prediction failed")
+    finally:
+        service.record_request(time.perf_counter() - start, status)
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    service: PredictionService = request.app[SERVICE_KEY]
+    return web.json_response({
+        'status': 'ok' if service.ready else 'unavailable',
+        'model_loaded': service.ready,
+        'generation': service.generation,
+        'uptime_seconds': time.time() - service.started_at,
+        'queue_depth': service.queue.qsize() if service.queue else 0,
+    }, status=200 if service.ready else 503)
+
+
+async def handle_latency(request: web.Request) -> web.Response:
+    service: PredictionService = request.app[SERVICE_KEY]
+    return web.json_response(service.latency_stats())
+
+
+def create_app(service: Optional[PredictionService] = None) -> web.Application:
+    app = web.Application()
+    app[SERVICE_KEY] = service or PredictionService()
+
+    async def on_startup(app: web.Application):
+        await app[SERVICE_KEY].start()
+
+    async def on_cleanup(app: web.Application):
+        await app[SERVICE_KEY].stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get('/predict', handle_predict)
+    app.router.add_post('/predict', handle_predict)
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/latency', handle_latency)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=SERVICE_HOST, port=SERVICE_PORT)
@@ -0,0 +1,310 @@
+import asyncio
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from aiohttp.test_utils import TestClient, TestServer, make_mocked_request
+from aiohttp import web
+from sklearn.ensemble import RandomForestClassifier
+
+import model as model_module
+from feature_engineering import FeatureIndex
+from model import PredictionModel
+from prediction_service import (PredictionCache, PredictionService, SERVICE_KEY, create_app, handle_predict,
+                                parse_matchup)
+
+LEAGUE_ID = 39
+TEAM_IDS = list(range(1, 11))
+
+
+def make_football_data():
+    return {
+        'standings': {str(LEAGUE_ID): {'response': [
+            {'team': {'id': team_id}, 'rank': rank, 'form': 'WDLWW'[:rank % 5 + 1], 'goalsDiff': 10 - 2 * rank}
+            for rank, team_id in enumerate(TEAM_IDS, start=1)
+        ]}},
+        'team_statistics': {str(LEAGUE_ID): {
+            str(team_id): {'clean_sheet': {'total': team_id % 4},
+                           'goals': {'for': {'average': {'total': 1.0 + team_id / 10}},
+                                     'against': {'average': {'total': 2.0 - team_id / 10}}}}
+            for team_id in TEAM_IDS
+        }},
+        'injuries': {str(LEAGUE_ID): {'response': [{'team': {'id': 1}}, {'team': {'id': 1}}, {'team': {'id': 2}}]}},
+        'h2h': {},
+    }
+
+
+@pytest.fixture
+def features():
+    return FeatureIndex(make_football_data())
+
+
+@pytest.fixture
+def trained_model(features, tmp_path, monkeypatch):
+    monkeypatch.setattr(model_module, 'DB_PATH', str(tmp_path / 'football_data.db'))
+    rows = pd.DataFrame([features.feature_row(home, away, LEAGUE_ID)
+                         for home in TEAM_IDS for away in TEAM_IDS if home != away])
+    labels = np.random.RandomState(0).choice(['home', 'draw', 'away'], size=len(rows))
+    prediction_model = PredictionModel()
+    prediction_model.scaler.fit(rows)
+    prediction_model.model = RandomForestClassifier(n_estimators=10, random_state=42)
+    prediction_model.model.fit(prediction_model.scaler.transform(rows), labels)
+    return prediction_model
+
+
+def make_service(trained_model, features, **kwargs):
+    kwargs.setdefault('reload_interval', 0)
+    kwargs.setdefault('data_path', 'missing_football_data.json')
+    return PredictionService(model=trained_model, features=features, **kwargs)
+
+
+async def start_cold(service):
+    """Start the service with an empty cache so requests go through the batching queue."""
+    await service.start()
+    service.cache.clear()
+
+
+def record_batches(service):
+    batches = []
+    infer = service.infer
+
+    def recording_infer(model, features, keys):
+        batches.append(list(keys))
+        return infer(model, features, keys)
+
+    service.infer = recording_infer
+    return batches
+
+
+def test_cache_evicts_least_recently_used():
+    cache = PredictionCache(max_size=2)
+    cache.set((39, 1, 2), {'n': 1})
+    cache.set((39, 1, 3), {'n': 2})
+    cache.get((39, 1, 2))
+    cache.set((39, 1, 4), {'n': 3})
+    assert cache.get((39, 1, 3)) is None
+    assert cache.get((39, 1, 2)) == {'n': 1}
+    assert cache.get((39, 1, 4)) == {'n': 3}
+
+
+def test_cache_pinned_entries_are_not_evicted():
+    cache = PredictionCache(max_size=1)
+    cache.replace({(39, 1, 2): {'n': 1}})
+    cache.set((39, 1, 3), {'n': 2})
+    cache.set((39, 1, 4), {'n': 3})
+    assert cache.get((39, 1, 2)) == {'n': 1}
+    assert cache.get((39, 1, 3)) is None
+    assert len(cache) == 2
+    cache.replace({})
+    assert cache.get((39, 1, 2)) is None and len(cache) == 0
+
+
+def test_start_prescores_every_matchup(trained_model, features):
+    async def run():
+        service = make_service(trained_model, features)
+        batches = record_batches(service)
+        await service.start()
+        try:
+            prediction = await service.predict(LEAGUE_ID, 3, 7)
+        finally:
+            await service.stop()
+        return service, batches, prediction
+
+    service, batches, prediction = asyncio.run(run())
+    assert len(service.cache.pinned) == len(TEAM_IDS) * (len(TEAM_IDS) - 1)
+    assert len(batches) == 1
+    assert prediction['cached'] and prediction['home_team_id'] == 3
+
+
+def test_predict_batch_matches_predict(trained_model, features):
+    rows = pd.DataFrame([features.feature_row(home, away, LEAGUE_ID) for home, away in [(1, 2), (3, 4), (5, 9)]])
+    batched = trained_model.predict_batch(rows)
+    single = [trained_model.predict(rows.iloc[[i]]) for i in range(len(rows))]
+    assert [outcome for outcome, _ in batched] == [outcome for outcome, _ in single]
+    assert np.allclose([p for _, p in batched], [p for _, p in single])
+
+
+def test_feature_index_matches_feature_engineering(monkeypatch):
+    import feature_engineering
+    data = make_football_data()
+    monkeypatch.setattr(feature_engineering, 'football_data', data)
+    expected = feature_engineering.feature_engineering(1, 2, LEAGUE_ID)
+    assert FeatureIndex(data).feature_row(1, 2, LEAGUE_ID) == expected.iloc[0].to_dict()
+
+
+def test_duplicate_in_flight_requests_are_coalesced(trained_model, features):
+    async def run():
+        service = make_service(trained_model, features)
+        await start_cold(service)
+        batches = record_batches(service)
+        try:
+            results = await asyncio.gather(*[service.predict(LEAGUE_ID, 1, 2) for _ in range(5)])
+        finally:
+            await service.stop()
+        return batches, results
+
+    batches, results = asyncio.run(run())
+    assert batches == [[(LEAGUE_ID, 1, 2)]]
+    assert all(result == results[0] for result in results)
+
+
+def test_batches_are_split_at_max_batch_size(trained_model, features):
+    async def run():
+        service = make_service(trained_model, features, batch_window_ms=5, max_batch_size=3)
+        await start_cold(service)
+        batches = record_batches(service)
+        try:
+            await asyncio.gather(*[service.predict(LEAGUE_ID, 1, away) for away in range(2, 9)])
+        finally:
+            await service.stop()
+        return batches
+
+    batches = asyncio.run(run())
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+
+def test_bad_matchup_does_not_fail_its_batch(trained_model, features, monkeypatch):
+    feature_row = features.feature_row
+
+    def failing_feature_row(home_team_id, away_team_id, league_id):
+        if home_team_id == 9:
+            raise KeyError('standings')
+        return feature_row(home_team_id, away_team_id, league_id)
+
+    monkeypatch.setattr(features, 'feature_row', failing_feature_row)
+
+    async def run():
+        service = make_service(trained_model, features)
+        await start_cold(service)
+        try:
+            results = await asyncio.gather(service.predict(LEAGUE_ID, 1, 2), service.predict(LEAGUE_ID, 9, 2),
+                                           service.predict(LEAGUE_ID, 3, 4), return_exceptions=True)
+        finally:
+            await service.stop()
+        return service, results
+
+    service, results = asyncio.run(run())
+    assert isinstance(results[1], KeyError)
+    assert results[0]['predicted_outcome'] and results[2]['predicted_outcome']
+    assert (LEAGUE_ID, 9, 2) not in service.cache.entries
+
+
+def test_failed_batch_call_falls_back_to_single_rows(trained_model, features, monkeypatch):
+    predict = trained_model.predict
+
+    def failing_predict_batch(X):
+        raise ValueError('bad row in batch')
+
+    def failing_predict(X):
+        if X.iloc[0]['home_team_rank'] == 5:
+            raise ValueError('bad row')
+        return predict(X)
+
+    monkeypatch.setattr(trained_model, 'predict_batch', failing_predict_batch)
+    monkeypatch.setattr(trained_model, 'predict', failing_predict)
+    service = make_service(trained_model, features)
+    results = service.infer(trained_model, features, [(LEAGUE_ID, 1, 2), (LEAGUE_ID, 5, 2), (LEAGUE_ID, 3, 4)])
+    assert isinstance(results[1], ValueError)
+    assert results[0]['home_team_id'] == 1 and results[2]['home_team_id'] == 3
+
+
+@pytest.mark.parametrize('params', [
+    {'league_id': 39, 'home_team_id': 1, 'away_team_id': 1},
+    {'league_id': 39, 'home_team_id': 1.9, 'away_team_id': 2},
+    {'league_id': 39, 'home_team_id': True, 'away_team_id': 2},
+    {'league_id': 39, 'home_team_id': '-1', 'away_team_id': 2},
+    {'league_id': 39, 'home_team_id': '\u00b2', 'away_team_id': 2},
+    {'league_id': 1, 'home_team_id': 1, 'away_team_id': 2},
+    {'league_id': 39, 'home_team_id': 1},
+])
+def test_parse_matchup_rejects_invalid_params(params):
+    with pytest.raises(web.HTTPBadRequest):
+        parse_matchup(params)
+
+
+def test_parse_matchup_accepts_ints_and_digit_strings():
+    assert parse_matchup({'league_id': '39', 'home_team_id': 1, 'away_team_id': '2'}) == (39, 1, 2)
+
+
+def test_http_predict_rejects_unknown_teams_and_records_errors(trained_model, features):
+    async def run():
+        service = make_service(trained_model, features)
+        async with TestClient(TestServer(create_app(service))) as client:
+            ok = await client.get('/predict', params={'league_id': 39, 'home_team_id': 1, 'away_team_id': 2})
+            missing = await client.post('/predict', json={'league_id': 39, 'home_team_id': 1, 'away_team_id': 999})
+            bad = await client.get('/predict', params={'league_id': 39, 'home_team_id': 'x', 'away_team_id': 2})
+            latency = await (await client.get('/latency')).json()
+            return ok.status, await ok.json(), missing.status, bad.status, latency
+
+    ok_status, prediction, missing_status, bad_status, latency = asyncio.run(run())
+    assert ok_status == 200 and prediction['home_team_id'] == 1
+    assert missing_status == 404
+    assert bad_status == 400
+    assert latency['requests'] == 3
+    assert latency['window'] == 3
+    assert latency['errors'] == {'404': 1, '400': 1}
+
+
+def test_cancelled_request_is_not_a_latency_sample(trained_model, features, monkeypatch):
+    async def abandoned_predict(*args):
+        raise asyncio.CancelledError()
+
+    service = make_service(trained_model, features)
+    monkeypatch.setattr(service, 'predict', abandoned_predict)
+    app = web.Application()
+    app[SERVICE_KEY] = service
+    request = make_mocked_request('GET', '/predict?league_id=39&home_team_id=1&away_team_id=2', app=app)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(handle_predict(request))
+    latency = service.latency_stats()
+    assert latency['errors'] == {'499': 1}
+    assert latency['window'] == 0
+
+
+def test_reload_swaps_model_and_rescores(trained_model, features):
+    trained_model.save_model()
+
+    async def run():
+        service = make_service(trained_model, features)
+        service.cache.set((LEAGUE_ID, 1, 2), {'predicted_outcome': 'stale'})
+        unchanged = await service.reload_model()
+        swapped = await service.reload_model(force=True)
+        return service, unchanged, swapped
+
+    service, unchanged, swapped = asyncio.run(run())
+    assert not unchanged and swapped
+    assert service.model is not trained_model and service.ready
+    assert service.generation == 1
+    assert service.cache.get((LEAGUE_ID, 1, 2))['predicted_outcome'] != 'stale'
+    assert len(service.cache.pinned) == len(TEAM_IDS) * (len(TEAM_IDS) - 1)
+
+
+def test_reload_waits_for_scaler_to_be_written(trained_model, features):
+    trained_model.save_model()
+    service = make_service(trained_model, features)
+    # New model written but the scaler still has the previous save's mtime
+    os.utime(trained_model.scaler_path, (1000, 1000))
+    os.utime(trained_model.model_path, (2000, 2000))
+    assert not asyncio.run(service.reload_model())
+    assert service.generation == 0
+
+    os.utime(trained_model.scaler_path, (2001, 2001))
+    assert asyncio.run(service.reload_model())
+    assert service.model_mtime == 2000
+
+
+def test_reload_data_rebuilds_feature_index(trained_model, features, tmp_path):
+    data_path = tmp_path / 'football_data.json'
+    data = make_football_data()
+    data_path.write_text(json.dumps(data))
+    service = make_service(trained_model, features, data_path=str(data_path))
+    assert not asyncio.run(service.reload_data())
+
+    data['standings'][str(LEAGUE_ID)]['response'].append({'team': {'id': 11}, 'rank': 11})
+    data_path.write_text(json.dumps(data))
+    os.utime(data_path, (service.data_mtime + 10, service.data_mtime + 10))
+    assert asyncio.run(service.reload_data())
+    assert service.features is not features and service.features.has_team(11, LEAGUE_ID)
+    assert service.cache.get((LEAGUE_ID, 11, 1)) is not None